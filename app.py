@@ -3,20 +3,19 @@ import os
 import json
 import threading
 import time
-from io import BytesIO
+import hashlib
 import mimetypes
-from mimetypes import guess_type
-from urllib.parse import unquote
-from flask import Flask, render_template, send_file, jsonify, request, url_for, abort, Response,request
+import functools
+from urllib.parse import unquote, quote
+from flask import Flask, render_template, stream_template, send_file, make_response, jsonify, request, url_for, abort, Response,request
 from dotenv import load_dotenv
 from PIL import Image
 import pillow_heif
-import re
 
 # register HEIF opener
 pillow_heif.register_heif_opener()
 
-from scanner import scan_folders_with_progress  # scanner will upsert to DB
+from scanner import scan_folders_with_progress, EXT_MAP  # scanner will upsert to DB
 import db as dbmod
 
 load_dotenv()
@@ -29,6 +28,7 @@ CACHE_FILE = os.getenv('CACHE_FILE', './file_index.json')
 MAX_WORKERS = int(os.getenv('MAX_WORKERS', '8'))
 ENABLE_FACE_DETECT = os.getenv('ENABLE_FACE_DETECT', '0') in ('1', 'true', 'True')
 ENABLE_VIDEO_PROBE = os.getenv('ENABLE_VIDEO_PROBE', '0') in ('1','true','True')  # optional ffprobe for videos
+THUMB_ACCEL_PREFIX = os.getenv('THUMB_ACCEL_PREFIX', '')  # optional nginx internal location for thumbnails, e.g. /_thumbs/
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
@@ -36,8 +36,21 @@ app = Flask(__name__, static_folder='static', template_folder='templates')
 dbmod.init_db()
 
 # near top of app.py (after imports)
-IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif', '.tiff'}
-VIDEO_EXTS = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
+# taken from the scanner's EXT_MAP so the app, scanner and DB queries agree on types
+IMAGE_EXTS = frozenset(EXT_MAP['images'])
+VIDEO_EXTS = frozenset(EXT_MAP['video'])
+# one dict lookup per row instead of two set membership tests
+_EXT_TO_TYPE = {e: 'images' for e in IMAGE_EXTS}
+_EXT_TO_TYPE.update({e: 'video' for e in VIDEO_EXTS})
+
+# mime type is a pure function of the (lowercased) extension, so memoize it
+@functools.lru_cache(maxsize=256)
+def _mime_for_ext(ext):
+    mime_type, _ = mimetypes.guess_type('file' + ext)
+    if not mime_type:
+        # common mapping for QuickTime MOV
+        mime_type = 'video/quicktime' if ext == '.mov' else 'application/octet-stream'
+    return mime_type
 
 
 
@@ -48,18 +61,31 @@ SCAN_STATE = {
     'total': 0,
     'stage': None,
     'last_update': None,
-    'message': ''
+    'message': '',
+    'warning': None
 }
 SCAN_LOCK = threading.Lock()
+# SSE clients wait on this instead of polling; notified on every state change
+SCAN_COND = threading.Condition(SCAN_LOCK)
 
 def _progress_cb(payload):
-    with SCAN_LOCK:
+    with SCAN_COND:
         SCAN_STATE.update(payload)
         SCAN_STATE['last_update'] = time.time()
+        SCAN_COND.notify_all()
+
+FILE_CACHE_TTL = 300  # seconds a cached get_file row may be served before it is re-read
+
+# the time bucket is part of the key, so entries expire after at most FILE_CACHE_TTL
+# even if a scan ran elsewhere; old buckets just age out of the LRU
+@functools.lru_cache(maxsize=4096)
+def _get_file_cached(path, bucket):
+    return dbmod.get_file(path)
 
 def _background_scan():
-    with SCAN_LOCK:
-        SCAN_STATE.update({'running': True, 'stage': 'start', 'done': 0, 'total': 0, 'message': 'Scan started'})
+    with SCAN_COND:
+        SCAN_STATE.update({'running': True, 'stage': 'start', 'done': 0, 'total': 0, 'message': 'Scan started', 'warning': None})
+        SCAN_COND.notify_all()
     try:
         scan_folders_with_progress(
             FOLDERS, THUMB_DIR, thumb_size=(THUMB_SIZE, THUMB_SIZE),
@@ -67,46 +93,26 @@ def _background_scan():
             enable_face_detect=ENABLE_FACE_DETECT, enable_video_probe=ENABLE_VIDEO_PROBE,
             progress_callback=_progress_cb
         )
-        with SCAN_LOCK:
-            SCAN_STATE.update({'running': False, 'stage': 'finished', 'message': 'Scan finished'})
+        with SCAN_COND:
+            # keep a scanner warning (e.g. a crashed worker) visible in the final status
+            warning = SCAN_STATE.get('warning')
+            message = f"Scan finished ({warning})" if warning else 'Scan finished'
+            SCAN_STATE.update({'running': False, 'stage': 'finished', 'message': message})
+            SCAN_COND.notify_all()
     except Exception as e:
-        with SCAN_LOCK:
+        with SCAN_COND:
             SCAN_STATE.update({'running': False, 'stage': 'error', 'message': str(e)})
+            SCAN_COND.notify_all()
+    finally:
+        # rows may have changed; drop cached metadata so views pick up the rescan
+        _get_file_cached.cache_clear()
 
 @app.route('/')
 def index():
-    # fetch recent media from DB (images + video)
-    all_files = dbmod.get_recent_media(limit=1000)
-
-    out = []
-    for f in all_files:
-        ext = (f.get('ext') or '').lower()
-        # fallback to DB category if ext missing
-        category = f.get('category') or ''
-
-        # canonicalize type using extension first (most reliable)
-        if ext in IMAGE_EXTS:
-            typ = 'images'
-        elif ext in VIDEO_EXTS:
-            typ = 'video'
-        else:
-            # fall back to DB category names if ext ambiguous
-            cat_lower = (category or '').lower()
-            if cat_lower.startswith('image') or cat_lower == 'images' or cat_lower == 'photo' or cat_lower == 'photos':
-                typ = 'images'
-            elif cat_lower.startswith('video') or cat_lower == 'video' or cat_lower == 'videos':
-                typ = 'video'
-            else:
-                typ = 'other'
-
-        out.append({
-            'path': f['path'],
-            'thumbnail': f.get('thumbnail'),
-            'ext': ext or f.get('ext'),
-            'type': typ
-        })
-
-    return render_template('index.html', all_files=out)
+    # fetch recent media from DB (images + video), already classified by type in SQL
+    all_files = dbmod.get_recent_media_typed(IMAGE_EXTS, VIDEO_EXTS, limit=1000)
+    # stream the page: Jinja renders card by card while rows are read off the cursor
+    return Response(stream_template('index.html', all_files=all_files))
 
 
 @app.route('/category/<cat>')
@@ -119,60 +125,80 @@ def view_category(cat):
     # Normalization - ensure category/value exists and ext present
     files = []
     for r in rows:
-        ext = (r.get('ext') or '').lower()
+        ext = r['ext'] or ''   # scanner stores extensions lowercased
         files.append({
-            'path': r.get('path'),
-            'thumbnail': r.get('thumbnail'),
+            'path': r['path'],
+            'thumbnail': r['thumbnail'],
             'ext': ext,
-            'name': r.get('name'),
-            'rel_path': r.get('rel_path'),
-            'category': r.get('category') or ('images' if ext in IMAGE_EXTS else ('video' if ext in VIDEO_EXTS else 'other'))
+            'name': r['name'],
+            'rel_path': r['rel_path'],
+            'category': r['category'] or _EXT_TO_TYPE.get(ext, 'other')
         })
     return render_template('category.html', cat=cat, files=files, subcats={})
 
+# configured roots resolved once at startup (FOLDERS does not change at runtime)
+_ALLOWED_ROOTS_EXACT = tuple(os.path.abspath(r) for r in FOLDERS if r)
+_ALLOWED_ROOTS = tuple(r.rstrip(os.sep) + os.sep for r in _ALLOWED_ROOTS_EXACT)
+
 # helper: make absolute-safe path check
 def _is_path_allowed(path):
-    # allow if path is inside any configured folder (resolve symlinks)
+    # allow if path is inside any configured folder; startswith(tuple) runs in C
     try:
         path = os.path.abspath(path)
-        for root in FOLDERS:
-            if not root:
-                continue
-            root_abs = os.path.abspath(root)
-            if path.startswith(root_abs + os.sep) or path == root_abs:
-                return True
-        return False
+        return path.startswith(_ALLOWED_ROOTS) or path in _ALLOWED_ROOTS_EXACT
     except Exception:
         return False
 
-# helper generator: yield whole file in chunks (no range)
-def _read_file_stream(path, chunk_size=64*1024):
-    with open(path, 'rb') as f:
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
-                break
-            yield chunk
+# absolute: it is written relative to the cwd, but send_file resolves relative paths against app.root_path
+HEIC_CACHE_DIR = os.path.abspath(os.path.join(THUMB_DIR, '_heic_cache'))
+HEIC_MAX_DIM = 2048  # longest side of the JPEG served for HEIC/HEIF sources
+HEIC_SIZES = (512, 1024, HEIC_MAX_DIM)  # ?w= snaps to one of these, so each file has few cached variants
 
-# helper: generator that yields file chunks
-def _read_file_range(path, start, length=None, chunk_size=64*1024):
-    with open(path, 'rb') as f:
-        f.seek(start)
-        remaining = length
-        while True:
-            if remaining is None:
-                chunk = f.read(chunk_size)
-            else:
-                to_read = min(chunk_size, remaining)
-                if to_read <= 0:
-                    break
-                chunk = f.read(to_read)
-                remaining -= len(chunk)
-            if not chunk:
-                break
-            yield chunk
+# helper: convert a HEIC/HEIF file to JPEG on first access and cache it on disk;
+# max_dim=None keeps the full resolution
+def _heic_jpeg_cache(path, src_mtime, max_dim=HEIC_MAX_DIM):
+    key = f"{path}|{max_dim or 'full'}"
+    cache_path = os.path.join(HEIC_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.jpg')
+    try:
+        if os.path.getmtime(cache_path) >= src_mtime:
+            return cache_path
+    except OSError:
+        pass
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(HEIC_CACHE_DIR, exist_ok=True)
+        with Image.open(path) as im:
+            if max_dim:
+                # draft lets JPEG-backed decoders scale in the DCT domain; thumbnail is in-place
+                im.draft('RGB', (max_dim, max_dim))
+                im.thumbnail((max_dim, max_dim), Image.LANCZOS)
+            if im.mode in ("RGBA", "P"):
+                im = im.convert("RGB")
+            im.save(tmp_path, format='JPEG', quality=85, optimize=False, progressive=True)
+        # atomic swap so concurrent viewers never see a half-written file
+        os.replace(tmp_path, cache_path)
+        return cache_path
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        return None
 
+PREFETCH_MAX_BYTES = 8 * 1024 * 1024
 
+# helper: hint the kernel to pull a byte range into the page cache (POSIX only)
+def _prefetch_range(path, start, length):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, start, min(length, PREFETCH_MAX_BYTES), os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
 
 # Replace view_file route so video files open viewer page (not direct file)
 @app.route('/file/view')
@@ -190,8 +216,10 @@ def view_file():
     # unquote in case the path contains spaces or special chars encoded in URLs
     path = unquote(path)
 
-    # Security: ensure path exists
-    if not os.path.exists(path):
+    # Security: ensure path exists (single stat)
+    try:
+        os.stat(path)
+    except (OSError, ValueError):
         return "File not found", 404
 
     # Security: ensure file is under allowed folders
@@ -208,21 +236,15 @@ def view_file():
 
     # determine extension and mime type
     ext = os.path.splitext(path)[1].lower()
-    mime_type, _ = guess_type(path)
-    if not mime_type:
-        if ext == '.mov':
-            # common mapping for QuickTime MOV
-            mime_type = 'video/quicktime'
-        else:
-            mime_type = 'application/octet-stream'
+    mime_type = _mime_for_ext(ext)
 
     # attempt to read DB metadata (orig_time, etc.) if available
     orig_time = None
     try:
-        meta = dbmod.get_file(path)
+        meta = _get_file_cached(path, int(time.monotonic() // FILE_CACHE_TTL))
         if meta:
             # meta['orig_time'] may be None; pass through
-            orig_time = meta.get('orig_time')
+            orig_time = meta['orig_time']
     except Exception:
         orig_time = None
 
@@ -253,102 +275,58 @@ def media():
     if not path:
         abort(404)
     path = unquote(path)
-    if not os.path.exists(path):
+    # one stat for existence, size and mtime
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
         abort(404)
     if not _is_path_allowed(path):
         abort(403)
 
-    # HEIC image on-the-fly convert (unchanged)
+    # HEIC image: convert to JPEG once, then serve the cached copy
     _, ext = os.path.splitext(path)
     ext = ext.lower()
     if ext in ('.heic', '.heif'):
-        try:
-            with Image.open(path) as im:
-                if im.mode in ("RGBA", "P"):
-                    im = im.convert("RGB")
-                buf = BytesIO()
-                im.save(buf, format='JPEG', quality=90)
-                buf.seek(0)
-                return send_file(buf, mimetype='image/jpeg')
-        except Exception:
-            pass
-
-    # Determine mime type (fallback for .mov -> video/quicktime)
-    mime_type, _ = mimetypes.guess_type(path)
-    if not mime_type:
-        if ext == '.mov':
-            mime_type = 'video/quicktime'
+        # ?full=1 serves the full resolution ("Open original"); otherwise an optional
+        # ?w= picks the smallest of HEIC_SIZES that covers it
+        if request.args.get('full', '0') in ('1', 'true', 'True'):
+            max_dim = None
         else:
-            mime_type = 'application/octet-stream'
+            w = request.args.get('w', HEIC_MAX_DIM, type=int)
+            max_dim = next((d for d in HEIC_SIZES if d >= w), HEIC_MAX_DIM)
+        cache_path = _heic_jpeg_cache(path, st.st_mtime, max_dim)
+        if cache_path:
+            return send_file(cache_path, mimetype='image/jpeg', conditional=True, max_age=86400)
 
-    file_size = os.path.getsize(path)
+    # Determine mime type (fallback for .mov -> video/quicktime)
+    mime_type = _mime_for_ext(ext)
 
     # If client explicitly requests no_range, always return full file (200)
     no_range_flag = request.args.get('no_range', '0') in ('1', 'true', 'True')
 
-    # If no_range requested: stream full file as 200 with Content-Length
+    # send_file hands the open file to wsgi.file_wrapper so the server can use
+    # sendfile(2); with conditional=True werkzeug also answers Range (206) itself
     if no_range_flag:
-        headers = {
-            'Content-Length': str(file_size),
-            'Content-Type': mime_type,
-            'Accept-Ranges': 'none',   # indicate we are not supporting range for this response
-            'Cache-Control': 'public, max-age=86400'
-        }
-        return Response(_read_file_stream(path), headers=headers)
-
-    # Otherwise, honor Range headers (normal behavior)
-    range_header = request.headers.get('Range', None)
-    headers_common = {
-        'Accept-Ranges': 'bytes',
-        'Cache-Control': 'public, max-age=86400'
-    }
-
-    if range_header:
-        # parse Range header: bytes=start-end
-        m = re.match(r'bytes=(\d*)-(\d*)', range_header)
-        if not m:
-            return Response(status=416)
-        gstart, gend = m.groups()
-        try:
-            if gstart == '':
-                # suffix range: last N bytes
-                suffix_len = int(gend)
-                start = max(0, file_size - suffix_len)
-                end = file_size - 1
-            else:
-                start = int(gstart)
-                end = int(gend) if gend else file_size - 1
-        except Exception:
-            return Response(status=416)
-
-        if start >= file_size:
-            return Response(status=416)
-
-        end = min(end, file_size - 1)
-        length = end - start + 1
-        headers = dict(headers_common)
-        headers.update({
-            'Content-Range': f'bytes {start}-{end}/{file_size}',
-            'Content-Length': str(length),
-            'Content-Type': mime_type
-        })
-        return Response(_read_file_range(path, start, length), status=206, headers=headers)
+        resp = send_file(path, mimetype=mime_type, conditional=False, max_age=86400)
+        resp.headers['Accept-Ranges'] = 'none'   # indicate we are not supporting range for this response
+        return resp
+
+    # video seeks arrive as Range requests: start read-ahead for that window before sendfile
+    if request.range is not None:
+        rng = request.range.range_for_length(st.st_size)
+        if rng:
+            _prefetch_range(path, rng[0], rng[1] - rng[0])
 
-    # No Range header and no_range_flag False: stream full file with Content-Length (200)
-    headers = dict(headers_common)
-    headers.update({
-        'Content-Length': str(file_size),
-        'Content-Type': mime_type
-    })
-    return Response(_read_file_stream(path), headers=headers)
+    return send_file(path, mimetype=mime_type, conditional=True, max_age=86400)
 
 @app.route('/refresh', methods=['POST'])
 def refresh():
     # start background scan if not already running
-    with SCAN_LOCK:
+    with SCAN_COND:
         if SCAN_STATE.get('running'):
             return jsonify(success=False, message='Scan already running'), 409
         SCAN_STATE.update({'running': True, 'stage': 'queued', 'message': 'Queued to start', 'done': 0, 'total': 0})
+        SCAN_COND.notify_all()
     t = threading.Thread(target=_background_scan, daemon=True)
     t.start()
     return jsonify(success=True, message='Scan started')
@@ -361,24 +339,36 @@ def scan_stream():
     def gen():
         last_sent = {}
         while True:
-            with SCAN_LOCK:
+            with SCAN_COND:
+                SCAN_COND.wait_for(lambda: SCAN_STATE != last_sent, timeout=30)
                 state = dict(SCAN_STATE)
             if state != last_sent:
                 yield sse_format("progress", state)
                 last_sent = state
+            else:
+                # nothing changed within the timeout: SSE comment keeps the connection alive
+                yield ": keepalive\n\n"
             if not state.get('running') and state.get('stage') in ('finished', 'error'):
                 break
-            time.sleep(0.5)
         with SCAN_LOCK:
-            yield sse_format("progress", dict(SCAN_STATE))
+            state = dict(SCAN_STATE)
+        yield sse_format("progress", state)
     return Response(gen(), mimetype='text/event-stream')
 
 @app.route('/thumbnail/<path:thumb_rel>')
 def thumbnail(thumb_rel):
+    if THUMB_ACCEL_PREFIX:
+        # hand the file back to nginx (X-Accel-Redirect) so it is served via sendfile without Flask
+        resp = make_response('')
+        resp.headers['X-Accel-Redirect'] = THUMB_ACCEL_PREFIX.rstrip('/') + '/' + quote(thumb_rel)
+        resp.headers['Content-Type'] = 'image/jpeg'
+        return resp
     tpath = os.path.join(THUMB_DIR, thumb_rel)
-    if not os.path.exists(tpath):
+    # send_file stats the file anyway; let that stat double as the existence check
+    try:
+        return send_file(tpath, mimetype='image/jpeg')
+    except FileNotFoundError:
         return "No Thumb", 404
-    return send_file(tpath, mimetype='image/jpeg')
 
 if __name__ == '__main__':
     host = os.getenv('FLASK_HOST', '0.0.0.0')
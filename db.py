@@ -1,7 +1,8 @@
 # db.py
 import sqlite3
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Iterator
 
 DB_PATH = os.getenv('INDEX_DB', './file_index.db')
 
@@ -23,25 +24,60 @@ CREATE TABLE IF NOT EXISTS files (
     thumbnail TEXT,
     scanned_at REAL
 );
-CREATE INDEX IF NOT EXISTS idx_category ON files(category);
 CREATE INDEX IF NOT EXISTS idx_mtime ON files(mtime);
 CREATE INDEX IF NOT EXISTS idx_ctime ON files(ctime);
 CREATE INDEX IF NOT EXISTS idx_orig ON files(orig_time);
 CREATE INDEX IF NOT EXISTS idx_scanned ON files(scanned_at);
+CREATE INDEX IF NOT EXISTS idx_category_time ON files(category, COALESCE(orig_time, mtime, ctime));
+-- category lookups use idx_category_time's leftmost column; the old single-column index is redundant
+DROP INDEX IF EXISTS idx_category;
+CREATE INDEX IF NOT EXISTS idx_effective_time ON files(COALESCE(orig_time, mtime, ctime) DESC) WHERE category IN ('images','video');
 """
 
+# one lazily-opened connection per thread; WAL lets readers run concurrently
+_local = threading.local()
+# serializes write transactions across threads
+_WRITE_LOCK = threading.Lock()
+
 def get_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
-    conn.execute('PRAGMA foreign_keys = ON;')
-    conn.execute('PRAGMA journal_mode = WAL;')
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON;')
+        conn.execute('PRAGMA journal_mode = WAL;')
+        conn.execute('PRAGMA synchronous = NORMAL;')
+        conn.execute('PRAGMA temp_store = MEMORY;')
+        conn.execute('PRAGMA mmap_size = 268435456;')
+        conn.execute('PRAGMA cache_size = -65536;')
+        _local.conn = conn
     return conn
 
 def init_db():
     conn = get_conn()
-    cur = conn.cursor()
-    cur.executescript(SCHEMA)
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        conn.executescript(SCHEMA)
+
+UPSERT_CHUNK = 5000
+
+def _upsert_params(entries):
+    # generator: executemany consumes tuples one at a time, no intermediate list
+    for e in entries:
+        yield (
+            e.get('path'),
+            e.get('folder_root'),
+            e.get('rel_path'),
+            e.get('name'),
+            e.get('ext'),
+            e.get('category'),
+            e.get('image_subcat'),
+            e.get('size'),
+            e.get('mtime'),
+            e.get('ctime'),
+            e.get('orig_time'),
+            e.get('thumbnail'),
+            e.get('scanned_at'),
+        )
 
 def upsert_files(entries: List[Dict[str, Any]]):
     if not entries:
@@ -66,49 +102,47 @@ def upsert_files(entries: List[Dict[str, Any]]):
         scanned_at=excluded.scanned_at
     ;
     """
-    params = []
-    for e in entries:
-        params.append((
-            e.get('path'),
-            e.get('folder_root'),
-            e.get('rel_path'),
-            e.get('name'),
-            e.get('ext'),
-            e.get('category'),
-            e.get('image_subcat'),
-            e.get('size'),
-            e.get('mtime'),
-            e.get('ctime'),
-            e.get('orig_time'),
-            e.get('thumbnail'),
-            e.get('scanned_at'),
-        ))
-    try:
-        cur.executemany(sql, params)
-        conn.commit()
-    finally:
-        conn.close()
+    with _WRITE_LOCK:
+        # one IMMEDIATE transaction => one WAL sync for the whole batch
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for i in range(0, len(entries), UPSERT_CHUNK):
+                cur.executemany(sql, _upsert_params(entries[i:i + UPSERT_CHUNK]))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 def delete_missing_files(seen_paths: List[str]):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("CREATE TEMP TABLE IF NOT EXISTS tmp_seen(path TEXT PRIMARY KEY);")
-    cur.execute("DELETE FROM tmp_seen;")
-    if seen_paths:
-        cur.executemany("INSERT OR IGNORE INTO tmp_seen(path) VALUES (?)", [(p,) for p in seen_paths])
-        cur.execute("DELETE FROM files WHERE path NOT IN (SELECT path FROM tmp_seen);")
-    conn.commit()
-    conn.close()
+    with _WRITE_LOCK:
+        cur.execute("BEGIN")
+        try:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS tmp_seen(path TEXT PRIMARY KEY);")
+            cur.execute("DELETE FROM tmp_seen;")
+            if seen_paths:
+                cur.executemany("INSERT OR IGNORE INTO tmp_seen(path) VALUES (?)", [(p,) for p in seen_paths])
+                cur.execute("DELETE FROM files WHERE path NOT IN (SELECT path FROM tmp_seen);")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def analyze():
+    # refresh planner statistics after a scan so the partial index is picked up
+    conn = get_conn()
+    with _WRITE_LOCK:
+        conn.execute("ANALYZE;")
 
 def get_category_counts() -> Dict[str,int]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT category, COUNT(*) FROM files GROUP BY category;")
     rows = cur.fetchall()
-    conn.close()
     return {r[0]: r[1] for r in rows}
 
-def get_files_by_category(category: str, limit:int=None, order_by:str='COALESCE(orig_time, mtime, ctime)', desc:bool=True) -> List[Dict[str,Any]]:
+def get_files_by_category(category: str, limit:int=None, order_by:str='COALESCE(orig_time, mtime, ctime)', desc:bool=True) -> List[sqlite3.Row]:
     conn = get_conn()
     cur = conn.cursor()
     q = f"SELECT path, folder_root, rel_path, name, ext, category, image_subcat, size, mtime, ctime, orig_time, thumbnail FROM files WHERE category=?"
@@ -117,27 +151,42 @@ def get_files_by_category(category: str, limit:int=None, order_by:str='COALESCE(
     if limit:
         q += f" LIMIT {limit}"
     cur.execute(q, (category,))
-    rows = cur.fetchall()
-    conn.close()
-    keys = ['path','folder_root','rel_path','name','ext','category','image_subcat','size','mtime','ctime','orig_time','thumbnail']
-    return [dict(zip(keys, r)) for r in rows]
+    return cur.fetchall()
 
-def get_recent_media(limit:int=500) -> List[Dict[str,Any]]:
+def get_recent_media(limit:int=500) -> List[sqlite3.Row]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT path, folder_root, rel_path, name, ext, category, image_subcat, size, mtime, ctime, orig_time, thumbnail FROM files WHERE category IN ('images','video') ORDER BY COALESCE(orig_time, mtime, ctime) DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    keys = ['path','folder_root','rel_path','name','ext','category','image_subcat','size','mtime','ctime','orig_time','thumbnail']
-    return [dict(zip(keys, r)) for r in rows]
+    return cur.fetchall()
+
+def get_recent_media_typed(image_exts, video_exts, limit:int=1000) -> Iterator[sqlite3.Row]:
+    # same rows as get_recent_media, with the gallery 'type' computed in SQL from the
+    # caller's extension sets (ext is stored lowercased); returns the cursor so callers
+    # can stream rows instead of materializing them
+    image_exts, video_exts = sorted(image_exts), sorted(video_exts)
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"""
+    SELECT path, thumbnail, ext,
+        CASE
+            WHEN ext IN ({','.join('?' * len(image_exts))}) THEN 'images'
+            WHEN ext IN ({','.join('?' * len(video_exts))}) THEN 'video'
+            ELSE COALESCE(category, 'other')
+        END AS type
+    FROM files WHERE category IN ('images','video')
+    ORDER BY COALESCE(orig_time, mtime, ctime) DESC LIMIT ?
+    """, (*image_exts, *video_exts, limit))
+    return cur
+
+def fetch_paths_mtime() -> Iterator[sqlite3.Row]:
+    # (path, mtime, thumbnail, orig_time) for every indexed file; used by incremental rescans
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT path, mtime, thumbnail, orig_time FROM files")
+    return cur
 
-def get_file(path: str) -> Optional[Dict[str,Any]]:
+def get_file(path: str) -> Optional[sqlite3.Row]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT id, path, folder_root, rel_path, name, ext, category, image_subcat, size, mtime, ctime, orig_time, thumbnail, scanned_at FROM files WHERE path=?", (path,))
-    row = cur.fetchone()
-    cols = ['id','path','folder_root','rel_path','name','ext','category','image_subcat','size','mtime','ctime','orig_time','thumbnail','scanned_at']
-    conn.close()
-    if not row:
-        return None
-    return dict(zip(cols, row))
+    return cur.fetchone()
@@ -3,13 +3,18 @@ import os
 import json
 import time
 import re
+import struct
 import subprocess
+import shutil
 from pathlib import Path
 from datetime import datetime
-from PIL import Image, ImageOps
+from PIL import Image
 import piexif
 import cv2
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+import multiprocessing
 
 import pillow_heif
 pillow_heif.register_heif_opener()
@@ -26,17 +31,20 @@ EXT_MAP = {
     'video': {'.mp4', '.mov', '.avi', '.mkv', '.webm'},
 }
 
+# inverted EXT_MAP: one hash lookup per file instead of a scan over the categories
+_EXT_TO_CAT = {e: k for k, s in EXT_MAP.items() for e in s}
+
 def classify_by_ext(ext):
-    ext = ext.lower()
-    for k, s in EXT_MAP.items():
-        if ext in s:
-            return k
-    return 'others'
+    # ext must already be lowercased (see _process_one)
+    return _EXT_TO_CAT.get(ext, 'others')
+
+_RE_SEP = re.compile(r'[:\s\\/]+')
+_RE_CLEAN = re.compile(r'[^A-Za-z0-9_\-\.]')
 
 def sanitize_folder_key(folder_path):
     key = folder_path.replace(os.sep, '_')
-    key = re.sub(r'[:\s\\/]+', '_', key)
-    key = re.sub(r'[^A-Za-z0-9_\-\.]', '', key)
+    key = _RE_SEP.sub('_', key)
+    key = _RE_CLEAN.sub('', key)
     if not key:
         key = "folder"
     return key
@@ -48,35 +56,115 @@ def read_exif(path):
     except Exception:
         return None
 
+# formats OpenCV decodes itself; HEIC/GIF/TIFF and anything it rejects stay on PIL
+_CV2_THUMB_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.webp'})
+# IMREAD_REDUCED_* only scales in the DCT domain for JPEG; other formats decode at full size
+# and then get a linear shrink, so they use IMREAD_COLOR and leave the shrink to INTER_AREA
+_CV2_REDUCED_EXTS = frozenset({'.jpg', '.jpeg'})
+_CV2_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def _cv2_thumbnail(src_path, dest_path, size=(256,256), ext=''):
+    """Decode (reduced for JPEG), resize and centre-crop with OpenCV, like ImageOps.fit."""
+    tw, th = size
+    flag = cv2.IMREAD_COLOR
+    if ext in _CV2_REDUCED_EXTS:
+        with Image.open(src_path) as probe:  # header only, to pick the decode reduction
+            w, h = probe.size
+        for factor, reduced in _CV2_REDUCED:
+            # keep >= 2x target before the final resize, same margin as the PIL draft() path
+            if w // factor >= tw * 2 and h // factor >= th * 2:
+                flag = reduced
+                break
+    img = cv2.imread(src_path, flag)
+    if img is None:
+        return False
+    return _cv2_fit_and_write(img, dest_path, size)
+
+def _cv2_fit_and_write(img, dest_path, size):
+    # encode through cv2.imwrite: opencv wheels bundle libjpeg-turbo (SIMD DCT/Huffman)
+    tw, th = size
+    ih, iw = img.shape[:2]
+    scale = max(tw / iw, th / ih)
+    rw, rh = max(tw, round(iw * scale)), max(th, round(ih * scale))
+    # INTER_AREA averages the source pixels when shrinking (LANCZOS4 is a fixed 8x8 kernel
+    # and aliases at the ratios left after decode); Lanczos only to enlarge
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_LANCZOS4
+    resized = cv2.resize(img, (rw, rh), interpolation=interp)
+    x, y = (rw - tw) // 2, (rh - th) // 2
+    return cv2.imwrite(dest_path, resized[y:y + th, x:x + tw], [cv2.IMWRITE_JPEG_QUALITY, 85])
+
 def make_thumbnail(src_path, dest_path, size=(256,256)):
-    """Always attempts to create thumbnail from src_path -> dest_path"""
+    """Always attempts to create thumbnail from src_path -> dest_path (dest dir must exist)"""
+    ext = os.path.splitext(src_path)[1].lower()
+    if ext in _CV2_THUMB_EXTS:
+        try:
+            if _cv2_thumbnail(src_path, dest_path, size, ext):
+                return True
+        except Exception:
+            pass
     try:
         with Image.open(src_path) as img:
-            img.thumbnail(size)
+            # JPEG only: DCT-domain pre-shrink to >= 2x target, then a single Lanczos pass below
+            img.draft(img.mode, (size[0] * 2, size[1] * 2))
             if img.mode in ("RGBA", "P"):
                 img = img.convert("RGB")
-            thumb = ImageOps.fit(img, size, Image.LANCZOS)
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            # centre crop to the target aspect like ImageOps.fit, but resize with reducing_gap
+            # so non-JPEG sources (HEIC/GIF/TIFF, where draft() is a no-op) are box-reduced
+            # first instead of running Lanczos over the full-resolution image
+            w, h = img.size
+            ratio = size[0] / size[1]
+            cw, ch = (h * ratio, h) if w / h > ratio else (w, w / ratio)
+            x, y = (w - cw) / 2, (h - ch) / 2
+            thumb = img.resize(size, Image.LANCZOS, box=(x, y, x + cw, y + ch), reducing_gap=2.0)
             thumb.save(dest_path, format='JPEG', quality=85)
             return True
     except Exception:
         return False
 
+# ffmpeg is optional; when present it handles video thumbnails (see make_video_thumbnail)
+_FFMPEG = shutil.which('ffmpeg')
+
+def _ffmpeg_video_thumbnail(src_path, dest_path, size=(256,256)):
+    """
+    Grab one frame near the start with ffmpeg: input-side keyframe seek, hardware
+    decode when available, and scale+crop to size in libswscale, written straight to JPEG.
+    """
+    w, h = size
+    tmp_path = dest_path + '.tmp.jpg'
+    cmd = [
+        _FFMPEG, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+        '-hwaccel', 'auto', '-ss', '0.5', '-i', src_path,
+        '-frames:v', '1',
+        '-vf', f'scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h}',
+        '-q:v', '3', tmp_path
+    ]
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=8)
+        # clips shorter than the seek point exit 0 without writing a frame
+        if proc.returncode == 0 and os.path.getsize(tmp_path) > 0:
+            os.replace(tmp_path, dest_path)
+            return True
+    except Exception:
+        pass
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+    return False
+
 def make_video_thumbnail(src_path, dest_path, size=(256,256)):
-    """Always attempts to create a video thumbnail by reading first frame"""
+    """Always attempts to create a video thumbnail (ffmpeg if available, else first frame via OpenCV); dest dir must exist"""
+    if _FFMPEG:
+        if _ffmpeg_video_thumbnail(src_path, dest_path, size):
+            return True
     try:
         cap = cv2.VideoCapture(src_path)
         success, frame = cap.read()
         cap.release()
         if not success or frame is None:
             return False
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(frame)
-        img.thumbnail(size)
-        thumb = ImageOps.fit(img, size, Image.LANCZOS)
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        thumb.save(dest_path, format='JPEG', quality=85)
-        return True
+        # frame is already BGR, so resize and encode it without a round-trip through PIL
+        return _cv2_fit_and_write(frame, dest_path, size)
     except Exception:
         return False
 
@@ -102,6 +190,16 @@ def parse_exif_datetime(s: str):
     if not s:
         return None
     s = s.strip()
+    # fast path for the fixed-width "YYYY:MM:DD HH:MM:SS" nearly every camera writes:
+    # slice out the fields instead of going through the pure-Python strptime
+    # (isdigit first: int() would accept padded fields like ' 1' that strptime rejects)
+    if (len(s) == 19 and s[4] == s[7] == s[13] == s[16] == ':' and s[10] == ' '
+            and (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]).isdigit()):
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                            int(s[11:13]), int(s[14:16]), int(s[17:19])).timestamp()
+        except ValueError:
+            pass  # e.g. the "0000:00:00 00:00:00" placeholder; let the fallbacks decide
     try:
         dt = datetime.strptime(s, EXIF_DATETIME_FORMAT)
         return dt.timestamp()
@@ -116,9 +214,83 @@ def parse_exif_datetime(s: str):
             except Exception:
                 return None
 
+# EXIF tag ids used by the fast JPEG path
+_TAG_DATETIME = 0x0132            # IFD0 DateTime
+_TAG_EXIF_IFD = 0x8769            # pointer to the Exif sub-IFD
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_DATETIME_DIGITIZED = 0x9004
+
+def _read_jpeg_exif(path):
+    """Return the TIFF payload of a JPEG's APP1/Exif segment, or None if there is none."""
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            hdr = f.read(4)
+            if len(hdr) < 4 or hdr[0] != 0xFF:
+                return None
+            marker = hdr[1]
+            seg_len = struct.unpack('>H', hdr[2:])[0]
+            if marker == 0xDA or seg_len < 2:
+                # start of scan: no metadata segments past this point
+                return None
+            if marker == 0xE1:
+                data = f.read(seg_len - 2)
+                if data[:6] == b'Exif\x00\x00':
+                    return data[6:]
+            else:
+                f.seek(seg_len - 2, 1)
+
+def _read_ifd_tags(tiff, offset, endian, wanted):
+    """Read the ASCII/LONG values of the wanted tags from one TIFF IFD."""
+    out = {}
+    try:
+        (count,) = struct.unpack_from(endian + 'H', tiff, offset)
+        for i in range(count):
+            pos = offset + 2 + i * 12
+            tag, typ, n, val = struct.unpack_from(endian + 'HHII', tiff, pos)
+            if tag not in wanted:
+                continue
+            if typ == 2:  # ASCII: inline when it fits in 4 bytes, otherwise an offset
+                start = pos + 8 if n <= 4 else val
+                out[tag] = tiff[start:start + n].split(b'\x00', 1)[0].decode('ascii', errors='ignore')
+            elif typ == 4:  # LONG (sub-IFD pointer)
+                out[tag] = val
+    except struct.error:
+        pass
+    return out
+
+def _fast_exif_dates(path):
+    """
+    Pull (DateTimeOriginal, DateTimeDigitized) straight out of a JPEG's APP1 segment,
+    without decoding the image or the full EXIF structure.
+    Returns None when the file is not a JPEG with EXIF, so callers can fall back.
+    """
+    tiff = _read_jpeg_exif(path)
+    if not tiff or tiff[:2] not in (b'II', b'MM'):
+        return None
+    endian = '<' if tiff[:2] == b'II' else '>'
+    (ifd0,) = struct.unpack_from(endian + 'I', tiff, 4)
+    tags = _read_ifd_tags(tiff, ifd0, endian, {_TAG_DATETIME, _TAG_EXIF_IFD})
+    if _TAG_EXIF_IFD in tags:
+        tags.update(_read_ifd_tags(tiff, tags[_TAG_EXIF_IFD], endian,
+                                   {_TAG_DATETIME_ORIGINAL, _TAG_DATETIME_DIGITIZED}))
+    raw = tags.get(_TAG_DATETIME_ORIGINAL) or tags.get(_TAG_DATETIME_DIGITIZED)
+    dto = parse_exif_datetime(raw)
+    dtd = parse_exif_datetime(tags.get(_TAG_DATETIME_DIGITIZED))
+    if not dto:
+        dto = parse_exif_datetime(tags.get(_TAG_DATETIME_ORIGINAL) or tags.get(_TAG_DATETIME))
+    return (dto, dtd)
+
 def get_exif_dates(path):
     try:
-        im = Image.open(path)
+        fast = _fast_exif_dates(path)
+        if fast is not None:
+            return fast
+    except Exception:
+        pass
+    # slow path: HEIC/TIFF/WebP or JPEGs the header walk could not handle
+    try:
         try:
             exif = piexif.load(path)
         except Exception:
@@ -140,7 +312,8 @@ def get_exif_dates(path):
                     dtd = parse_exif_datetime(d_raw)
         if not dto:
             try:
-                exif_dict = getattr(im, '_getexif', lambda: {})() or {}
+                with Image.open(path) as im:
+                    exif_dict = getattr(im, '_getexif', lambda: {})() or {}
                 raw = exif_dict.get(36867) or exif_dict.get(306)
                 if raw:
                     dto = parse_exif_datetime(raw)
@@ -180,36 +353,160 @@ def get_video_creation_time_ffprobe(path):
     except Exception:
         return None
 
+_EXIF_EXTS = frozenset({'.jpg', '.jpeg', '.heic', '.heif', '.tiff'})
+_VIDEO_EXTS = frozenset(EXT_MAP['video'])
+
 def get_original_time(path, ext, enable_video_probe=False):
-    ext = ext.lower()
-    img_exts = {'.jpg', '.jpeg', '.heic', '.heif', '.tiff'}
-    video_exts = {'.mp4', '.mov', '.avi', '.mkv', '.webm'}
-    if ext in img_exts:
+    # ext must already be lowercased (see _process_one)
+    if ext in _EXIF_EXTS:
         dto, dtd = get_exif_dates(path)
         return dto or dtd
-    if ext in video_exts and enable_video_probe:
+    if ext in _VIDEO_EXTS and enable_video_probe:
         vt = get_video_creation_time_ffprobe(path)
         return vt
     return None
 # ---------- end orig time helpers ----------
 
+def _iter_files(folder, root):
+    """
+    Recursive os.scandir walk yielding (folder, path, name, stat) per file.
+    DirEntry.stat() is cached on the entry, so each file costs a single stat.
+    Like os.walk, symlinked directories are not descended into.
+    """
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        yield from _iter_files(folder, entry.path)
+                    continue
+                st = entry.stat()
+            except OSError:
+                # broken symlink or file vanished mid-walk
+                continue
+            yield (folder, entry.path, entry.name, st)
+
 def _collect_all_files(folders):
-    all_files = []
+    # generator, so the scan can start processing while the walk is still running
     for folder in folders:
         if not os.path.exists(folder):
             continue
-        for root, dirs, files in os.walk(folder):
-            for fn in files:
-                full = os.path.join(root, fn)
-                all_files.append((folder, full, fn))
-    return all_files
+        yield from _iter_files(folder, folder)
+
+def _thumb_missing_or_stale(src_path, thumb_path, unchanged):
+    # unchanged source with the same thumbnail path: one stat for existence (a deleted
+    # or previously failed thumbnail is rebuilt), no mtime comparison against the source
+    if unchanged:
+        return not os.path.exists(thumb_path)
+    return thumbnail_needs_update(src_path, thumb_path)
+
+def _process_one(args, thumb_dir, folder_keys, thumb_size=(256,256), enable_video_probe=False):
+    # module-level (not a closure) so it pickles for ProcessPoolExecutor workers
+    # known: (mtime, thumbnail, orig_time) from the previous scan, or None
+    folder, full, fn, st, known = args
+    # lowercase once here; classify_by_ext/get_original_time rely on it
+    dot = fn.rfind('.')
+    ext = fn[dot:].lower() if dot > 0 else ''
+    cat = classify_by_ext(ext)
+    try:
+        rel = os.path.relpath(full, folder)
+    except Exception:
+        rel = fn
+    # stat came from the scandir walk; no extra syscalls here
+    size = st.st_size
+    mtime = st.st_mtime
+    ctime = st.st_ctime
+
+    entry = {
+        'path': full,
+        'name': fn,
+        'ext': ext,
+        'folder_root': folder,
+        'rel_path': rel,
+        'size': size,
+        'mtime': mtime,
+        'ctime': ctime
+    }
+
+    # unchanged since the last scan: reuse the DB's metadata instead of re-reading the file
+    unchanged = known is not None and known[0] == mtime
+
+    # original capture time (EXIF or optional ffprobe for videos)
+    if unchanged and known[2] is not None:
+        orig = known[2]
+    else:
+        try:
+            orig = get_original_time(full, ext, enable_video_probe=enable_video_probe)
+        except Exception:
+            orig = None
+    entry['orig_time'] = orig
+
+    # Thumbnail logic: for unchanged files only check the thumbnail still exists,
+    # otherwise only create thumbnail if missing or source newer than thumb
+    if cat == 'images':
+        folder_key = folder_keys[folder]
+        safe_rel = rel.replace(os.sep, '_').replace('..', '_')
+        thumb_rel = os.path.join(folder_key, safe_rel + '.jpg')
+        thumb_path = os.path.join(thumb_dir, thumb_rel)
+        if _thumb_missing_or_stale(full, thumb_path, unchanged and known[1] == thumb_rel):
+            make_thumbnail(full, thumb_path, size=thumb_size)
+        entry['thumbnail'] = thumb_rel
+        # image_subcat removed for now
+        entry['image_subcat'] = None
+    elif cat == 'video':
+        folder_key = folder_keys[folder]
+        safe_rel = rel.replace(os.sep, '_').replace('..', '_')
+        thumb_rel = os.path.join(folder_key, safe_rel + '.jpg')
+        thumb_path = os.path.join(thumb_dir, thumb_rel)
+        if _thumb_missing_or_stale(full, thumb_path, unchanged and known[1] == thumb_rel):
+            make_video_thumbnail(full, thumb_path, size=thumb_size)
+        entry['thumbnail'] = thumb_rel
+        entry['image_subcat'] = None
+    else:
+        entry['thumbnail'] = None
+        entry['image_subcat'] = None
+
+    return (cat, entry)
+
+# files per task sent to a worker: one future and one pickle round-trip per chunk
+# instead of per file, which dominates when most files are unchanged and cheap
+SCAN_CHUNKSIZE = 32
+
+def _process_chunk(chunk, **kwargs):
+    # per-file failures become None so one bad file doesn't drop the whole chunk
+    results = []
+    for args in chunk:
+        try:
+            results.append(_process_one(args, **kwargs))
+        except Exception:
+            results.append(None)
+    return results
+
+# the JSON cache stores each category column-wise ({column: [values...]}) rather than
+# as a list of per-file dicts, so a large scan keeps lists of scalars in memory, not 100k dicts
+CACHE_COLUMNS = ('path', 'name', 'ext', 'folder_root', 'rel_path', 'size', 'mtime', 'ctime', 'orig_time', 'thumbnail')
+
+def _write_cache(cache_file, index):
+    # compact json.dumps runs on the C encoder; json.dump(indent=2) falls back to
+    # the pure-Python iterencode and writes many small chunks
+    try:
+        data = json.dumps(index, separators=(',', ':'))
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+    except Exception:
+        pass
 
 def scan_folders_with_progress(folders, thumb_dir, thumb_size=(256,256), cache_file=None,
                                max_workers=8, enable_face_detect=False, enable_video_probe=False, progress_callback=None):
     """
-    Scans folders using a thread pool and reports progress.
+    Scans folders using a process pool and reports progress.
     Thumbnails are (re)generated only when missing or source is newer than thumbnail.
     Screenshot/selfie categorization is currently disabled.
+    Returns the index dict; each category is stored column-wise (see CACHE_COLUMNS).
     """
     start = time.time()
     index = {
@@ -218,90 +515,58 @@ def scan_folders_with_progress(folders, thumb_dir, thumb_size=(256,256), cache_f
         'categories': {}
     }
 
-    all_files = _collect_all_files(folders)
-    total = len(all_files)
-    if progress_callback:
-        progress_callback({'stage':'collected','total':total})
-    else:
-        print(f"[scanner] collected {total} files to process")
-
-    if total == 0:
-        if cache_file:
-            try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(index, f, indent=2)
-            except Exception:
-                pass
-        return index
-
-    def process_one(args):
-        folder, full, fn = args
-        ext = os.path.splitext(fn)[1].lower()
-        cat = classify_by_ext(ext)
-        try:
-            rel = os.path.relpath(full, folder)
-        except Exception:
-            rel = fn
-        size = os.path.getsize(full) if os.path.exists(full) else 0
-        mtime = os.path.getmtime(full) if os.path.exists(full) else 0
-        ctime = os.path.getctime(full) if os.path.exists(full) else mtime
-
-        entry = {
-            'path': full,
-            'name': fn,
-            'ext': ext,
-            'folder_root': folder,
-            'rel_path': rel,
-            'size': size,
-            'mtime': mtime,
-            'ctime': ctime
-        }
-
-        # original capture time (EXIF or optional ffprobe for videos)
-        try:
-            orig = get_original_time(full, ext, enable_video_probe=enable_video_probe)
-        except Exception:
-            orig = None
-        entry['orig_time'] = orig
-
-        # Thumbnail logic: only create thumbnail if missing or source newer than thumb
-        if cat == 'images':
-            folder_key = sanitize_folder_key(folder)
-            safe_rel = rel.replace(os.sep, '_').replace('..', '_')
-            thumb_rel = os.path.join(folder_key, safe_rel + '.jpg')
-            thumb_path = os.path.join(thumb_dir, thumb_rel)
-            if thumbnail_needs_update(full, thumb_path):
-                make_thumbnail(full, thumb_path, size=thumb_size)
-            entry['thumbnail'] = thumb_rel
-            # image_subcat removed for now
-            entry['image_subcat'] = None
-        elif cat == 'video':
-            folder_key = sanitize_folder_key(folder)
-            safe_rel = rel.replace(os.sep, '_').replace('..', '_')
-            thumb_rel = os.path.join(folder_key, safe_rel + '.jpg')
-            thumb_path = os.path.join(thumb_dir, thumb_rel)
-            if thumbnail_needs_update(full, thumb_path):
-                make_video_thumbnail(full, thumb_path, size=thumb_size)
-            entry['thumbnail'] = thumb_rel
-            entry['image_subcat'] = None
-        else:
-            entry['thumbnail'] = None
-            entry['image_subcat'] = None
-
-        return (cat, entry)
-
     # process files and upsert to DB in batches
     done = 0
-    BATCH_SIZE = 500
+    total = 0
+    BATCH_SIZE = 5000  # upsert_files commits each batch in one transaction
     batch = []
     seen_paths = []
+    # set when a worker crash lost files; their rows are then kept rather than pruned
+    crashed = False
+    walk_done = False
 
-    with ThreadPoolExecutor(max_workers=max_workers) as exc:
-        future_to_item = {exc.submit(process_one, args): args for args in all_files}
-        for fut in as_completed(future_to_item):
-            try:
-                cat, entry = fut.result()
-                index['categories'].setdefault(cat, []).append(entry)
+    # thumbnail subdir per root, computed once instead of per file
+    folder_keys = {f: sanitize_folder_key(f) for f in folders}
+
+    # what the previous scan recorded, so unchanged files skip decode/resize entirely
+    try:
+        known = {r['path']: (r['mtime'], r['thumbnail'], r['orig_time']) for r in dbmod.fetch_paths_mtime()}
+    except Exception:
+        known = {}
+    # if a root's thumbnail dir is gone (e.g. wiped cache), regenerate everything under it
+    stale_roots = {f for f, k in folder_keys.items() if not os.path.isdir(os.path.join(thumb_dir, k))}
+    # thumbnails are flattened to <thumb_dir>/<folder_key>/<rel>.jpg, so these are the
+    # only directories needed; create them once here instead of per thumbnail
+    for k in folder_keys.values():
+        try:
+            os.makedirs(os.path.join(thumb_dir, k), exist_ok=True)
+        except OSError:
+            pass
+
+    # decode/resize is CPU-bound, so use processes to get past the GIL
+    process_chunk = partial(_process_chunk, thumb_dir=thumb_dir, folder_keys=folder_keys,
+                            thumb_size=thumb_size, enable_video_probe=enable_video_probe)
+
+    def handle(fut, chunk):
+        nonlocal done, batch, crashed
+        try:
+            results = fut.result()
+        except BrokenProcessPool:
+            # a worker died (e.g. a decoder crash). Don't retry in-process: the same file
+            # would take down the server. Give up on the chunks that were in flight
+            results = [None] * len(chunk)
+            crashed = True
+        except Exception:
+            results = [None] * len(chunk)
+
+        for res in results:
+            if res is not None:
+                cat, entry = res
+                cols = index['categories'].get(cat)
+                if cols is None:
+                    cols = index['categories'][cat] = {c: [] for c in CACHE_COLUMNS}
+                for c in CACHE_COLUMNS:
+                    cols[c].append(entry.get(c))
                 row = {
                     'path': entry['path'],
                     'folder_root': entry['folder_root'],
@@ -319,8 +584,6 @@ def scan_folders_with_progress(folders, thumb_dir, thumb_size=(256,256), cache_f
                 }
                 batch.append(row)
                 seen_paths.append(entry['path'])
-            except Exception:
-                pass
 
             done += 1
 
@@ -331,11 +594,70 @@ def scan_folders_with_progress(folders, thumb_dir, thumb_size=(256,256), cache_f
                     pass
                 batch = []
 
-            if progress_callback:
-                progress_callback({'stage':'processing','done':done,'total':total})
-            else:
-                if done % 50 == 0 or done == total:
-                    print(f"[scanner] processed {done}/{total}")
+            if not progress_callback and (done % 50 == 0 or done == total):
+                print(f"[scanner] processed {done}/{total}")
+
+        if progress_callback:
+            # 'collecting' while the walk is still growing total, so done/total isn't a percentage yet
+            progress_callback({'stage':'processing' if walk_done else 'collecting','done':done,'total':total})
+
+    workers = max_workers or os.cpu_count()
+    # never fork: this runs on a background thread of a (possibly multithreaded) server
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    mp_context = multiprocessing.get_context(start_method)
+    exc = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+    pending = {}
+
+    def submit(chunk):
+        nonlocal exc
+        try:
+            fut = exc.submit(process_chunk, chunk)
+        except BrokenProcessPool:
+            # a worker crashed; chunks already in flight fail in handle(), and the
+            # rest of the walk goes to a fresh pool
+            exc.shutdown(wait=False, cancel_futures=True)
+            exc = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+            fut = exc.submit(process_chunk, chunk)
+        pending[fut] = chunk
+
+    try:
+        # feed the pool while the walk is still discovering files, SCAN_CHUNKSIZE files
+        # per task; bound the in-flight chunks so a huge tree isn't queued all at once
+        # (exc.map would consume the whole walk up front before yielding anything)
+        chunk = []
+        for args in _collect_all_files(folders):
+            total += 1
+            chunk.append(args + (None if args[0] in stale_roots else known.get(args[1]),))
+            if len(chunk) >= SCAN_CHUNKSIZE:
+                submit(chunk)
+                chunk = []
+            if pending:
+                # collect whatever has finished so progress and upserts keep moving on a
+                # slow walk; block only once the in-flight bound is reached
+                full = len(pending) >= workers * 4
+                finished, _ = wait(pending, timeout=None if full else 0,
+                                   return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    handle(fut, pending.pop(fut))
+        if chunk:
+            submit(chunk)
+
+        # walk finished: total is final from here on
+        walk_done = True
+        if progress_callback:
+            progress_callback({'stage':'processing','done':done,'total':total})
+        else:
+            print(f"[scanner] collected {total} files to process")
+
+        for fut in as_completed(pending):
+            handle(fut, pending[fut])
+    finally:
+        exc.shutdown()
+
+    if total == 0:
+        if cache_file:
+            _write_cache(cache_file, index)
+        return index
 
     # flush last batch
     if batch:
@@ -344,23 +666,31 @@ def scan_folders_with_progress(folders, thumb_dir, thumb_size=(256,256), cache_f
         except Exception:
             pass
 
-    # cleanup DB entries for files removed from disk
+    # cleanup DB entries for files removed from disk; after a worker crash seen_paths
+    # is incomplete, so skip it this time rather than drop rows of files that still exist
+    crash_msg = "a worker crashed; keeping rows of files not seen this scan"
     try:
-        dbmod.delete_missing_files(seen_paths)
+        if crashed:
+            if progress_callback:
+                progress_callback({'stage':'processing','done':done,'total':total,'message':crash_msg})
+            else:
+                print(f"[scanner] {crash_msg}")
+        else:
+            dbmod.delete_missing_files(seen_paths)
+        dbmod.analyze()
     except Exception:
         pass
 
     # optionally write JSON cache as small summary
     if cache_file:
-        try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(index, f, indent=2)
-        except Exception:
-            pass
+        _write_cache(cache_file, index)
 
     elapsed = time.time() - start
     if progress_callback:
-        progress_callback({'stage':'done','total':total,'elapsed':elapsed})
+        done_state = {'stage':'done','total':total,'elapsed':elapsed}
+        if crashed:
+            done_state['warning'] = crash_msg
+        progress_callback(done_state)
     else:
         print(f"[scanner] done: {total} files in {elapsed:.1f}s")
 